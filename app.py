@@ -1,5 +1,4 @@
-from flask import Flask, render_template, request, jsonify
-from datetime import datetime
+from flask import Flask, render_template, request
 import logging
 from dotenv import load_dotenv
 import os
@@ -8,9 +7,14 @@ import sqlite3
 from contextlib import contextmanager
 from functools import wraps
 import time
-from flask_limiter import Limiter
-from flask_limiter.util import get_remote_address
-import re
+import threading
+import orjson
+import hashlib
+from validation import is_valid_tracking_number
+from db import connect_db
+from formatting import format_timestamp
+from telegram_session import SESSION
+from waitress import serve
 
 # Set up logging
 logging.basicConfig(
@@ -26,63 +30,118 @@ if not TELEGRAM_BOT_TOKEN:
     raise ValueError("TELEGRAM_BOT_TOKEN environment variable is not set")
 
 app = Flask(__name__)
-limiter = Limiter(
-    app=app,
-    key_func=get_remote_address,
-    default_limits=["200 per day", "50 per hour"]
-)
+
+# Rate limits per endpoint: (max requests, window in seconds)
+RATE_LIMITS = {
+    'index': (50, 3600),
+    'get_tracking': (30, 60),
+    'get_tracking_numbers': (30, 60),
+    'update_tracking': (10, 60),
+}
+
+class WindowLimiter:
+    """Fixed-window request counter keyed by client, endpoint and window bucket"""
+    def __init__(self, limits):
+        self.limits = limits
+        self.counts = {}
+        self.lock = threading.Lock()
+        self.last_prune = 0
+
+    def is_allowed(self, client, endpoint):
+        if endpoint not in self.limits:
+            return True
+
+        max_requests, window = self.limits[endpoint]
+        now = time.time()
+        key = (client, endpoint, int(now // window))
+        with self.lock:
+            if now - self.last_prune >= 60:
+                self.prune(now)
+            count = self.counts.get(key, 0) + 1
+            self.counts[key] = count
+        return count <= max_requests
+
+    def prune(self, now):
+        """Drop counters for windows that have already closed"""
+        self.counts = {
+            k: v for k, v in self.counts.items()
+            if k[2] >= int(now // self.limits[k[1]][1])
+        }
+        self.last_prune = now
+
+limiter = WindowLimiter(RATE_LIMITS)
+
+@app.before_request
+def enforce_rate_limit():
+    if not limiter.is_allowed(request.remote_addr, request.endpoint):
+        return ojsonify({'error': 'Rate limit exceeded'}, 429)
 
 # Database configuration
 DB_PATH = 'tracking.db'
-DB_TIMEOUT = 30  # seconds
 MAX_RETRIES = 3
 RETRY_DELAY = 1  # seconds
 
+# Server configuration
+SERVER_HOST = os.getenv('HOST', '127.0.0.1')
+SERVER_PORT = int(os.getenv('PORT', '5000'))
+SERVER_THREADS = int(os.getenv('SERVER_THREADS', '8'))
+
 # Cache configuration
 class Cache:
+    """Holds (body, etag) pairs of serialized JSON so hits skip re-encoding"""
     def __init__(self):
         self.duration = 60  # seconds
-        self.tracking_data = []
-        self.tracking_numbers = []
+        # Each entry is a single tuple so readers never see a mismatched body and ETag
+        self.tracking_data = None
+        self.tracking_numbers = None
         self.last_update = 0
+        # Bumped by clear() so results queried before an invalidation are discarded
+        self.generation = 0
+        self.lock = threading.Lock()
 
     def is_fresh(self):
         return time.time() - self.last_update < self.duration
 
-    def update(self, tracking_data=None, tracking_numbers=None):
-        if tracking_data is not None:
-            self.tracking_data = tracking_data
-        if tracking_numbers is not None:
-            self.tracking_numbers = tracking_numbers
-        self.last_update = time.time()
+    def update(self, generation, tracking_data=None, tracking_numbers=None):
+        with self.lock:
+            if generation != self.generation:
+                return
+            if tracking_data is not None:
+                self.tracking_data = tracking_data
+            if tracking_numbers is not None:
+                self.tracking_numbers = tracking_numbers
+            self.last_update = time.time()
 
     def clear(self):
-        self.tracking_data = []
-        self.tracking_numbers = []
-        self.last_update = 0
+        with self.lock:
+            self.generation += 1
+            self.tracking_data = None
+            self.tracking_numbers = None
+            self.last_update = 0
+
+def serialize_json(obj):
+    """Serialize obj to JSON bytes and derive an ETag from the body"""
+    body = orjson.dumps(obj)
+    etag = hashlib.blake2b(body, digest_size=8).hexdigest()
+    return body, etag
+
+def ojsonify(obj, status=200):
+    """Build a JSON response encoded with orjson"""
+    return app.response_class(orjson.dumps(obj), status=status, mimetype='application/json')
+
+def cached_json_response(body, etag):
+    """Return pre-serialized JSON, or 304 if the client already has this ETag"""
+    if request.if_none_match.contains(etag):
+        response = app.response_class(status=304)
+    else:
+        response = app.response_class(body, mimetype='application/json')
+    response.set_etag(etag)
+    # Clients must revalidate so dashboard edits show up immediately
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
 
 cache = Cache()
 
-def is_valid_tracking_number(tracking_number):
-    """Validate India Post tracking number format"""
-    # Remove spaces from the tracking number
-    tracking_number = tracking_number.replace(" ", "")
-    
-    # Check if the tracking number matches the format: 2 letters + 9 numbers + 2 letters
-    if not re.match(r'^[A-Z]{2}\d{9}[A-Z]{2}$', tracking_number):
-        return False
-    
-    # Check if the first letter is valid (E for Speed Post, R for Registered Post, A for Air Waybill)
-    first_letter = tracking_number[0]
-    if first_letter not in ['E', 'R', 'A']:
-        return False
-    
-    # Check if the last two letters are 'IN'
-    if tracking_number[-2:] != 'IN':
-        return False
-    
-    return True
-
 def format_tracking_number(tracking_number):
     """Format tracking number with spaces for better readability"""
     # Remove any existing spaces
@@ -99,7 +158,7 @@ def get_db():
     """Get database connection with proper error handling"""
     conn = None
     try:
-        conn = sqlite3.connect(DB_PATH, timeout=DB_TIMEOUT)
+        conn = connect_db(DB_PATH)
         conn.row_factory = sqlite3.Row
         yield conn
     except sqlite3.Error as e:
@@ -107,10 +166,15 @@ def get_db():
         raise
     finally:
         if conn:
+            # Let SQLite refresh planner statistics for tables this connection touched
+            try:
+                conn.execute("PRAGMA optimize")
+            except sqlite3.Error as e:
+                logger.warning(f"PRAGMA optimize failed: {str(e)}")
             conn.close()
 
 def db_operation(func):
-    """Decorator for database operations with retry logic"""
+    """Decorator for schema setup with retry logic; DB_TIMEOUT lock waits cover regular queries"""
     @wraps(func)
     def wrapper(*args, **kwargs):
         for attempt in range(MAX_RETRIES):
@@ -134,18 +198,31 @@ def init_db():
                     chat_id TEXT,
                     status TEXT,
                     status_details TEXT,
-                    last_updated INTEGER
+                    last_updated INTEGER,
+                    created_at INTEGER DEFAULT (strftime('%s', 'now'))
                 )
             """)
             # Create indexes for faster queries
-            conn.execute("CREATE INDEX idx_last_updated ON tracking(last_updated)")
             conn.execute("CREATE INDEX idx_chat_id ON tracking(chat_id)")
             logger.info("Created new database with indexes")
     else:
         logger.info("Using existing database")
 
-def send_telegram_message(chat_id, message, retry_count=3):
-    """Send a message to a Telegram chat with retry logic"""
+    # WAL mode is stored in the database file, so make sure existing databases get it too
+    with get_db() as conn:
+        conn.execute("PRAGMA journal_mode=WAL")
+        # Covering index so the dashboard listing is an index-only scan; its last_updated
+        # prefix also serves the bot's range scan, replacing the old idx_last_updated
+        conn.execute("""
+            CREATE INDEX IF NOT EXISTS idx_lu_cover
+            ON tracking(last_updated DESC, tracking_number, status, status_details)
+        """)
+        conn.execute("DROP INDEX IF EXISTS idx_last_updated")
+        # Gather statistics so the planner can choose between the indexes
+        conn.execute("ANALYZE tracking")
+
+def send_telegram_message(chat_id, message):
+    """Send a message to a Telegram chat; retries are handled by the session adapter"""
     url = f"https://api.telegram.org/bot{TELEGRAM_BOT_TOKEN}/sendMessage"
     payload = {
         "chat_id": chat_id,
@@ -153,48 +230,48 @@ def send_telegram_message(chat_id, message, retry_count=3):
         "parse_mode": "Markdown"
     }
     
-    for attempt in range(retry_count):
-        try:
-            response = requests.post(url, json=payload, timeout=10)
-            response.raise_for_status()
-            logger.info(f"Successfully sent message to chat_id {chat_id}")
-            return True
-        except requests.RequestException as e:
-            if attempt == retry_count - 1:
-                logger.error(f"Failed to send message to chat_id {chat_id}: {str(e)}")
-                return False
-            logger.warning(f"Telegram API request failed, retrying... ({attempt + 1}/{retry_count})")
-            time.sleep(1)
-    return False
+    try:
+        response = SESSION.post(url, json=payload, timeout=10)
+        response.raise_for_status()
+        logger.info(f"Successfully sent message to chat_id {chat_id}")
+        return True
+    except requests.RequestException as e:
+        logger.error(f"Failed to send message to chat_id {chat_id}: {str(e)}")
+        return False
 
-def format_status_message(tracking_number, status, details, last_updated):
-    """Format the status message with emojis and better structure"""
-    status_emojis = {
-        'Order Placed': '📦',
-        'Processing': '⚙️',
-        'Picked Up': '🚚',
-        'In Transit': '✈️',
-        'Out for Delivery': '🚛',
-        'Delivered': '✅',
-        'Failed Delivery': '❌',
-        'Returned': '↩️',
-    }
-    
-    emoji = status_emojis.get(status, '📋')
-    last_updated_str = datetime.fromtimestamp(last_updated).strftime('%Y-%m-%d %H:%M:%S')
-    
-    message = f"""
+# Status message building blocks, built once at import time
+STATUS_EMOJIS = {
+    'Order Placed': '📦',
+    'Processing': '⚙️',
+    'Picked Up': '🚚',
+    'In Transit': '✈️',
+    'Out for Delivery': '🚛',
+    'Delivered': '✅',
+    'Failed Delivery': '❌',
+    'Returned': '↩️',
+}
+
+STATUS_MESSAGE_TEMPLATE = """
 📦 *Package Status Update*
 
 Tracking Number: `{tracking_number}`
 Status: {emoji} *{status}*
-Time: {last_updated_str}
+Time: {timestamp}
 
 {details}
 
 _This is an automated message. Please do not reply._
 """
-    return message
+
+def format_status_message(tracking_number, status, details, last_updated):
+    """Format the status message with emojis and better structure"""
+    return STATUS_MESSAGE_TEMPLATE.format_map({
+        'tracking_number': tracking_number,
+        'emoji': STATUS_EMOJIS.get(status, '📋'),
+        'status': status,
+        'timestamp': format_timestamp(last_updated),
+        'details': details,
+    })
 
 # Predefined status options
 STATUS_OPTIONS = {
@@ -214,14 +291,14 @@ def index():
     return render_template('index.html', status_options=STATUS_OPTIONS)
 
 @app.route('/api/tracking', methods=['GET'])
-@limiter.limit("30 per minute")
-@db_operation
 def get_tracking():
     try:
         # Return cached data if it's still fresh
-        if cache.is_fresh() and cache.tracking_data:
-            return jsonify(cache.tracking_data)
+        cached = cache.tracking_data
+        if cached is not None and cache.is_fresh():
+            return cached_json_response(*cached)
 
+        generation = cache.generation
         with get_db() as conn:
             cursor = conn.execute("""
                 SELECT tracking_number, status, status_details, last_updated 
@@ -233,41 +310,42 @@ def get_tracking():
                 'tracking_number': item['tracking_number'],
                 'status': item['status'],
                 'status_details': item['status_details'],
-                'last_updated': datetime.fromtimestamp(item['last_updated']).strftime('%Y-%m-%d %H:%M:%S')
+                # Raw epoch seconds; the dashboard formats them in the browser
+                'last_updated': item['last_updated']
             } for item in items]
             
             # Update cache
-            cache.update(tracking_data=result)
+            body, etag = serialize_json(result)
+            cache.update(generation, tracking_data=(body, etag))
             
-            return jsonify(result)
+            return cached_json_response(body, etag)
     except Exception as e:
         logger.error(f"Error fetching tracking items: {str(e)}")
-        return jsonify({'error': 'Failed to fetch tracking items'}), 500
+        return ojsonify({'error': 'Failed to fetch tracking items'}, 500)
 
 @app.route('/api/tracking/numbers', methods=['GET'])
-@limiter.limit("30 per minute")
-@db_operation
 def get_tracking_numbers():
     try:
         # Return cached data if it's still fresh
-        if cache.is_fresh() and cache.tracking_numbers:
-            return jsonify(cache.tracking_numbers)
+        cached = cache.tracking_numbers
+        if cached is not None and cache.is_fresh():
+            return cached_json_response(*cached)
 
+        generation = cache.generation
         with get_db() as conn:
             cursor = conn.execute("SELECT tracking_number FROM tracking ORDER BY tracking_number")
             numbers = [row['tracking_number'] for row in cursor.fetchall()]
             
             # Update cache
-            cache.update(tracking_numbers=numbers)
+            body, etag = serialize_json(numbers)
+            cache.update(generation, tracking_numbers=(body, etag))
             
-            return jsonify(numbers)
+            return cached_json_response(body, etag)
     except Exception as e:
         logger.error(f"Error fetching tracking numbers: {str(e)}")
-        return jsonify({'error': 'Failed to fetch tracking numbers'}), 500
+        return ojsonify({'error': 'Failed to fetch tracking numbers'}, 500)
 
 @app.route('/api/tracking/update', methods=['POST'])
-@limiter.limit("10 per minute")
-@db_operation
 def update_tracking():
     try:
         data = request.json
@@ -277,46 +355,44 @@ def update_tracking():
 
         # Input validation
         if not tracking_number or not new_status:
-            return jsonify({'error': 'Missing required fields'}), 400
+            return ojsonify({'error': 'Missing required fields'}, 400)
         
         if not is_valid_tracking_number(tracking_number):
-            return jsonify({
+            return ojsonify({
                 'error': 'Invalid tracking number format',
                 'details': 'Please provide a valid India Post tracking number in the format: XX 123 456 789 IN'
-            }), 400
+            }, 400)
             
         if not validate_status(new_status):
-            return jsonify({'error': 'Invalid status'}), 400
+            return ojsonify({'error': 'Invalid status'}, 400)
 
         with get_db() as conn:
-            # Get current status
-            cursor = conn.execute(
-                "SELECT status FROM tracking WHERE tracking_number = ?",
-                (tracking_number,)
-            )
-            result = cursor.fetchone()
-            
-            if not result:
-                return jsonify({'error': 'Tracking number not found'}), 404
-
-            # Update status
-            current_time = int(datetime.now().timestamp())
-            conn.execute("""
+            # Update status; no matched row means the tracking number doesn't exist.
+            # SQLite stamps last_updated once it holds the write lock, so a slow lock wait
+            # can't leave the row behind the bot's notification watermark.
+            cursor = conn.execute("""
                 UPDATE tracking 
-                SET status = ?, status_details = ?, last_updated = ? 
+                SET status = ?, status_details = ?, last_updated = strftime('%s', 'now') 
                 WHERE tracking_number = ?
-            """, (new_status, status_details, current_time, tracking_number))
-            conn.commit()
+            """, (new_status, status_details, tracking_number))
+            
+            if cursor.rowcount == 0:
+                return ojsonify({'error': 'Tracking number not found'}, 404)
 
             # Clear cache
             cache.clear()
 
             logger.info(f"Updated status for {tracking_number} to {new_status}")
-            return jsonify({'message': 'Status updated successfully'})
+            return ojsonify({'message': 'Status updated successfully'})
     except Exception as e:
         logger.error(f"Error updating status: {str(e)}")
-        return jsonify({'error': 'Failed to update status'}), 500
+        return ojsonify({'error': 'Failed to update status'}, 500)
 
 if __name__ == '__main__':
     init_db()
-    app.run(debug=True) 
\ No newline at end of file
+    # Only an explicit '1' enables the Werkzeug debugger, which allows code execution
+    if os.getenv('FLASK_DEBUG') == '1':
+        app.run(debug=True)
+    else:
+        # Multi-threaded production server so a slow request doesn't block the rest
+        serve(app, host=SERVER_HOST, port=SERVER_PORT, threads=SERVER_THREADS) 
\ No newline at end of file
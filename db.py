@@ -0,0 +1,26 @@
+import sqlite3
+from typing import Optional
+
+DB_TIMEOUT = 30  # seconds to wait on a locked database before raising
+
+# Per-connection SQLite tuning; journal_mode=WAL is persistent on the DB file.
+# The lock wait is set by sqlite3.connect(timeout=DB_TIMEOUT), not a busy_timeout pragma.
+DB_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-20000",
+    "PRAGMA mmap_size=134217728",
+)
+
+def connect_db(db_path: str, isolation_level: Optional[str] = None) -> sqlite3.Connection:
+    """Open a connection with WAL mode and the tuning pragmas applied"""
+    conn = sqlite3.connect(
+        db_path,
+        timeout=DB_TIMEOUT,
+        isolation_level=isolation_level,
+        check_same_thread=False
+    )
+    for pragma in DB_PRAGMAS:
+        conn.execute(pragma)
+    return conn
@@ -0,0 +1,7 @@
+from datetime import datetime
+from functools import lru_cache
+
+@lru_cache(maxsize=4096)
+def format_timestamp(timestamp: int) -> str:
+    """Format a Unix timestamp for display, memoized since rows often share one"""
+    return datetime.fromtimestamp(timestamp).strftime('%Y-%m-%d %H:%M:%S')
@@ -12,9 +12,21 @@ const STATUS_MAP = {
 	'Failed Delivery': 'failed',
 }
 
+// 'sv-SE' renders as YYYY-MM-DD HH:MM:SS in the browser's timezone
+const DATE_FORMAT = new Intl.DateTimeFormat('sv-SE', {
+	year: 'numeric',
+	month: '2-digit',
+	day: '2-digit',
+	hour: '2-digit',
+	minute: '2-digit',
+	second: '2-digit',
+})
+
 // Utility Functions
 const formatTrackingNumber = (number) => number.replace(/\s/g, '')
 
+const formatTimestamp = (epochSeconds) => DATE_FORMAT.format(new Date(epochSeconds * 1000))
+
 const showNotification = (message, type = 'success') => {
 	const notification = document.createElement('div')
 	notification.className = `fixed top-4 right-4 p-4 rounded-lg shadow-lg ${
@@ -84,7 +96,7 @@ async function fetchTrackingData() {
         <td class="font-mono">${displayNumber}</td>
         <td><span class="status-badge ${getStatusClass(item.status)}">${item.status}</span></td>
         <td>${item.status_details}</td>
-        <td>${item.last_updated}</td>
+        <td>${formatTimestamp(item.last_updated)}</td>
       `
 
 			fragment.appendChild(row)
@@ -0,0 +1,21 @@
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+HTTP_MAX_RETRIES = 3
+# Statuses retried by the adapter; other 4xx responses are final
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+# Shared HTTP session so Telegram API calls reuse pooled keep-alive connections
+SESSION = requests.Session()
+SESSION.headers.update({"Connection": "keep-alive"})
+SESSION.mount("https://", HTTPAdapter(
+    pool_connections=4,
+    pool_maxsize=16,
+    max_retries=Retry(
+        total=HTTP_MAX_RETRIES,
+        backoff_factor=0.5,
+        status_forcelist=list(RETRY_STATUSES),
+        allowed_methods=frozenset(["GET", "POST"])
+    )
+))
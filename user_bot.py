@@ -1,14 +1,21 @@
 import requests
 import sqlite3
 import time
+import threading
 import os
+import json
+import hashlib
 from dotenv import load_dotenv
 import logging
-from datetime import datetime
-import re
-from typing import Dict, List, Optional, Tuple
+from typing import Deque, Dict, List, Optional, Tuple
 from dataclasses import dataclass
-from collections import defaultdict
+from enum import Enum
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+from validation import is_valid_tracking_number
+from db import connect_db
+from formatting import format_timestamp
+from telegram_session import SESSION, RETRY_STATUSES
 
 # Set up logging with more detailed format
 logging.basicConfig(
@@ -29,37 +36,27 @@ if not TOKEN:
 
 # Constants
 API_BASE_URL = "https://api.telegram.org/bot"
-MAX_RETRIES = 3
-RETRY_DELAY = 1
 RATE_LIMIT_DELAY = 1
 MAX_REQUESTS_PER_MINUTE = 30
-CHECK_INTERVAL = 10  # Check for updates every 10 seconds
+MAX_MESSAGES_PER_SECOND = 30  # Telegram's global sendMessage limit
+MAX_NOTIFY_WORKERS = 8
+PER_CHAT_SEND_INTERVAL = 1  # Seconds between messages to one chat (Telegram's per-chat limit)
+MAX_SEND_ATTEMPTS = 30  # Status notifications are dropped after this many failed scans
+CHECK_INTERVAL = 10  # Check for status changes every 10 seconds
+LONG_POLL_TIMEOUT = 25  # Seconds Telegram may hold getUpdates open
 DATABASE_PATH = "tracking.db"
-
-def is_valid_tracking_number(tracking_number: str) -> bool:
-    """Validate India Post tracking number format"""
-    # Remove spaces from the tracking number
-    tracking_number = tracking_number.replace(" ", "")
-    
-    # Check if the tracking number matches the format: 2 letters + 9 numbers + 2 letters
-    if not re.match(r'^[A-Z]{2}\d{9}[A-Z]{2}$', tracking_number):
-        return False
-    
-    # Check if the first letter is valid (E for Speed Post, R for Registered Post, A for Air Waybill)
-    first_letter = tracking_number[0]
-    if first_letter not in ['E', 'R', 'A']:
-        return False
-    
-    # Check if the last two letters are 'IN'
-    if tracking_number[-2:] != 'IN':
-        return False
-    
-    return True
+INITIAL_STATUS = "Order Placed"  # Status given to rows inserted by /track
+COMMANDS_MARKER_PREFIX = ".cmds_"  # Marks a command menu that was already sent
 
 def format_tracking_number(tracking_number: str) -> str:
     """Format tracking number without spaces"""
     return tracking_number.replace(" ", "")
 
+class SendResult(Enum):
+    SENT = "sent"
+    RETRY = "retry"  # Rate limited or a transient error; worth sending again later
+    REJECTED = "rejected"  # Telegram refused the message (e.g. bot blocked); don't retry
+
 @dataclass
 class TrackingInfo:
     tracking_number: str
@@ -72,27 +69,82 @@ class RateLimiter:
     def __init__(self, max_requests: int, time_window: int):
         self.max_requests = max_requests
         self.time_window = time_window
-        self.requests: Dict[str, List[float]] = defaultdict(list)
+        self.requests: Dict[str, Deque[float]] = defaultdict(deque)
+        self.last_cleanup = time.time()
+        self.lock = threading.Lock()
 
     def is_allowed(self, chat_id: str) -> bool:
-        current_time = time.time()
-        self.requests[chat_id] = [t for t in self.requests[chat_id] 
-                                if current_time - t < self.time_window]
-        
-        if len(self.requests[chat_id]) >= self.max_requests:
-            return False
-        
-        self.requests[chat_id].append(current_time)
-        return True
+        with self.lock:
+            current_time = time.time()
+            cutoff = current_time - self.time_window
+            if current_time - self.last_cleanup >= self.time_window:
+                self.cleanup(cutoff)
+
+            dq = self.requests[chat_id]
+            # Timestamps are appended in order, so expired ones are always on the left
+            while dq and dq[0] <= cutoff:
+                dq.popleft()
+            
+            if len(dq) >= self.max_requests:
+                return False
+            
+            dq.append(current_time)
+            return True
+
+    def cleanup(self, cutoff: float) -> None:
+        """Forget chats with no requests inside the current window"""
+        for chat_id in [c for c, dq in self.requests.items() if not dq or dq[-1] <= cutoff]:
+            del self.requests[chat_id]
+        self.last_cleanup = time.time()
+
+class TokenBucket:
+    """Thread-safe token bucket that blocks until a token is available"""
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.last_refill = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self) -> None:
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.last_refill) * self.rate)
+                self.last_refill = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
 
 class DatabaseManager:
     def __init__(self, db_path: str = DATABASE_PATH):
         self.db_path = db_path
+        # Long-lived connections: an autocommit reader and a transactional writer
+        self._read_conn = self.connect(isolation_level=None)
+        self._write_conn = self.connect()
+        self._read_lock = threading.Lock()
+        self._write_lock = threading.Lock()
         self.setup_database()
 
+    def connect(self, isolation_level: Optional[str] = "") -> sqlite3.Connection:
+        """Open a connection to this manager's database"""
+        return connect_db(self.db_path, isolation_level)
+
+    def close(self) -> None:
+        """Refresh planner statistics and close the long-lived connections"""
+        try:
+            with self._write_lock:
+                self._write_conn.execute("PRAGMA optimize")
+        except sqlite3.Error as e:
+            logger.warning(f"PRAGMA optimize failed: {str(e)}")
+        self._read_conn.close()
+        self._write_conn.close()
+
     def setup_database(self):
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._write_lock, self._write_conn as conn:
                 conn.execute("""
                     CREATE TABLE IF NOT EXISTS tracking (
                         tracking_number TEXT PRIMARY KEY,
@@ -108,10 +160,16 @@ class DatabaseManager:
                     CREATE INDEX IF NOT EXISTS idx_chat_id 
                     ON tracking(chat_id)
                 """)
+                # Same covering index as app.py; it also serves the last_updated range scan
                 conn.execute("""
-                    CREATE INDEX IF NOT EXISTS idx_last_updated 
-                    ON tracking(last_updated)
+                    CREATE INDEX IF NOT EXISTS idx_lu_cover 
+                    ON tracking(last_updated DESC, tracking_number, status, status_details)
                 """)
+                conn.execute("DROP INDEX IF EXISTS idx_last_updated")
+                # Tables created by app.py predate created_at; ALTER can't use the strftime default
+                columns = {row[1] for row in conn.execute("PRAGMA table_info(tracking)")}
+                if 'created_at' not in columns:
+                    conn.execute("ALTER TABLE tracking ADD COLUMN created_at INTEGER")
                 logger.info("Database setup completed successfully")
         except sqlite3.Error as e:
             logger.error(f"Error setting up database: {str(e)}")
@@ -119,25 +177,18 @@ class DatabaseManager:
 
     def add_tracking(self, tracking_info: TrackingInfo) -> bool:
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                conn.row_factory = sqlite3.Row
-                # Check if tracking number already exists
-                existing = conn.execute(
-                    "SELECT status FROM tracking WHERE tracking_number = ?",
-                    (tracking_info.tracking_number,)
-                ).fetchone()
+            with self._write_lock, self._write_conn as conn:
+                # Insert only if the tracking number is new; use strftime for timestamps
+                cursor = conn.execute("""
+                    INSERT OR IGNORE INTO tracking 
+                    (tracking_number, chat_id, status, status_details, last_updated, created_at) 
+                    VALUES (?, ?, ?, ?, strftime('%s', 'now'), strftime('%s', 'now'))
+                """, (tracking_info.tracking_number, tracking_info.chat_id,
+                     tracking_info.status, tracking_info.status_details))
                 
-                if existing:
+                if cursor.rowcount != 1:
                     logger.info(f"Tracking number {tracking_info.tracking_number} already exists")
                     return False
-                
-                # Use strftime for timestamp
-                conn.execute("""
-                    INSERT INTO tracking 
-                    (tracking_number, chat_id, status, status_details, last_updated) 
-                    VALUES (?, ?, ?, ?, strftime('%s', 'now'))
-                """, (tracking_info.tracking_number, tracking_info.chat_id,
-                     tracking_info.status, tracking_info.status_details))
                 return True
         except sqlite3.Error as e:
             logger.error(f"Database error while adding tracking: {str(e)}")
@@ -145,8 +196,8 @@ class DatabaseManager:
 
     def get_tracking_by_chat_id(self, chat_id: str) -> List[Tuple]:
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                return conn.execute("""
+            with self._read_lock:
+                return self._read_conn.execute("""
                     SELECT tracking_number, status, status_details, last_updated 
                     FROM tracking 
                     WHERE chat_id = ?
@@ -156,29 +207,45 @@ class DatabaseManager:
             logger.error(f"Database error while fetching tracking: {str(e)}")
             return []
 
-    def get_all_tracking(self) -> List[Tuple]:
+    def get_updated_since(self, timestamp: int) -> List[Tuple]:
+        """Fetch rows updated after the given timestamp, oldest first"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                return conn.execute("""
+            # Only closed seconds are returned so later writes in the watermark's second aren't
+            # skipped; rows untouched since /track inserted them were already confirmed
+            with self._read_lock:
+                return self._read_conn.execute("""
                     SELECT tracking_number, chat_id, status, status_details, last_updated 
                     FROM tracking 
-                    ORDER BY last_updated DESC
-                """).fetchall()
+                    WHERE last_updated > ?
+                      AND last_updated < strftime('%s', 'now')
+                      AND NOT (status = ? AND created_at IS NOT NULL AND last_updated = created_at)
+                    ORDER BY last_updated
+                """, (timestamp, INITIAL_STATUS)).fetchall()
         except sqlite3.Error as e:
-            logger.error(f"Database error while fetching all tracking: {str(e)}")
+            logger.error(f"Database error while fetching updated tracking: {str(e)}")
             return []
 
+    def get_latest_update(self) -> int:
+        """Return the most recent closed-second last_updated timestamp, or 0 if there are no rows"""
+        try:
+            with self._read_lock:
+                return self._read_conn.execute("""
+                    SELECT COALESCE(MAX(last_updated), 0) FROM tracking
+                    WHERE last_updated < strftime('%s', 'now')
+                """).fetchone()[0]
+        except sqlite3.Error as e:
+            logger.error(f"Database error while fetching latest update: {str(e)}")
+            return 0
+
     def cleanup_old_tracking(self, days: int = 30) -> int:
         """Remove tracking entries older than specified days"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._write_lock, self._write_conn as conn:
                 cursor = conn.execute("""
                     DELETE FROM tracking 
                     WHERE last_updated < strftime('%s', 'now', '-' || ? || ' days')
                 """, (days,))
-                deleted_count = cursor.rowcount
-                conn.commit()
-                return deleted_count
+                return cursor.rowcount
         except sqlite3.Error as e:
             logger.error(f"Database error while cleaning up old tracking: {str(e)}")
             return 0
@@ -188,21 +255,16 @@ class TelegramBot:
         self.token = TOKEN
         self.db = DatabaseManager()
         self.rate_limiter = RateLimiter(MAX_REQUESTS_PER_MINUTE, 60)
-        self.status_emojis = {
-            'Order Placed': '📦',
-            'Processing': '⚙️',
-            'Picked Up': '🚚',
-            'In Transit': '✈️',
-            'Out for Delivery': '🚛',
-            'Delivered': '✅',
-            'Failed Delivery': '❌',
-            'Returned': '↩️',
-        }
-        # Set up commands menu
-        self.set_commands()
+        self.send_limiter = TokenBucket(MAX_MESSAGES_PER_SECOND, MAX_MESSAGES_PER_SECOND)
+        self.executor = ThreadPoolExecutor(max_workers=MAX_NOTIFY_WORKERS)
+        # Only rows updated after this watermark trigger status notifications
+        self._watermark: int = self.db.get_latest_update()
+        # Rows whose notification failed, keyed by tracking number, retried next scan
+        # Value is (row, failed attempts) so hopeless sends are eventually dropped
+        self._failed: Dict[str, Tuple[Tuple, int]] = {}
 
     def set_commands(self) -> None:
-        """Set up the bot's command menu"""
+        """Set up the bot's command menu, skipping it if this menu was already set"""
         url = f"{API_BASE_URL}{self.token}/setMyCommands"
         commands = [
             {"command": "track", "description": "Track a new package"},
@@ -210,18 +272,35 @@ class TelegramBot:
             {"command": "help", "description": "Show help message"}
         ]
         payload = {"commands": commands}
+
+        # Marker file named after the token and command list; changing either re-sends
+        digest = hashlib.sha1(
+            (self.token + json.dumps(commands, sort_keys=True)).encode()
+        ).hexdigest()
+        marker = COMMANDS_MARKER_PREFIX + digest
+        if os.path.exists(marker):
+            logger.info("Bot commands menu already up to date")
+            return
         
         try:
-            response = requests.post(url, json=payload, timeout=10)
+            response = SESSION.post(url, json=payload, timeout=10)
             response.raise_for_status()
+            open(marker, 'w').close()
             logger.info("Successfully set up bot commands menu")
         except requests.RequestException as e:
             logger.error(f"Failed to set up bot commands menu: {str(e)}")
+        except OSError as e:
+            logger.warning(f"Could not write commands marker file: {str(e)}")
 
-    def send_message(self, chat_id: str, message: str, retry_count: int = 0) -> bool:
+    def send_message(self, chat_id: str, message: str) -> bool:
+        return self.deliver_message(chat_id, message) is SendResult.SENT
+
+    def deliver_message(self, chat_id: str, message: str) -> SendResult:
+        """Send a message and report whether a failure is worth retrying"""
         if not self.rate_limiter.is_allowed(chat_id):
             logger.warning(f"Rate limit exceeded for chat_id {chat_id}")
-            return False
+            return SendResult.RETRY
+        self.send_limiter.acquire()
 
         url = f"{API_BASE_URL}{self.token}/sendMessage"
         payload = {
@@ -231,48 +310,52 @@ class TelegramBot:
         }
 
         try:
-            response = requests.post(url, json=payload, timeout=10)
+            response = SESSION.post(url, json=payload, timeout=10)
             response.raise_for_status()
             logger.info(f"Successfully sent message to chat_id {chat_id}")
-            return True
+            return SendResult.SENT
+        except requests.HTTPError as e:
+            logger.error(f"Failed to send message to chat_id {chat_id}: {str(e)}")
+            status = e.response.status_code if e.response is not None else None
+            # 4xx other than 429 (blocked bot, chat not found, bad markup) won't succeed on retry
+            if status is not None and 400 <= status < 500 and status not in RETRY_STATUSES:
+                return SendResult.REJECTED
+            return SendResult.RETRY
         except requests.RequestException as e:
-            if retry_count < MAX_RETRIES:
-                logger.warning(f"Retrying message send to chat_id {chat_id} after error: {str(e)}")
-                time.sleep(RETRY_DELAY)
-                return self.send_message(chat_id, message, retry_count + 1)
             logger.error(f"Failed to send message to chat_id {chat_id}: {str(e)}")
-            return False
+            return SendResult.RETRY
 
     def get_updates(self, offset: Optional[int] = None) -> List[Dict]:
         url = f"{API_BASE_URL}{self.token}/getUpdates"
-        params = {"offset": offset} if offset else {}
+        params = {
+            "offset": offset,
+            "timeout": LONG_POLL_TIMEOUT,
+            "allowed_updates": json.dumps(["message"])
+        }
         
         try:
-            response = requests.get(url, params=params, timeout=10)
+            # Client timeout must outlast the server-side long poll
+            response = SESSION.get(url, params=params, timeout=LONG_POLL_TIMEOUT + 5)
             response.raise_for_status()
             return response.json().get("result", [])
         except requests.RequestException as e:
             logger.error(f"Failed to get updates: {str(e)}")
+            # Without a long poll holding the loop, back off before the next attempt
+            time.sleep(RATE_LIMIT_DELAY)
             return []
 
     def format_status_message(self, tracking_number: str, status: str, 
                             details: str, last_updated: int, include_footer: bool = False) -> str:
-        emoji = self.status_emojis.get(status, '📋')
-        last_updated_str = datetime.fromtimestamp(last_updated).strftime('%Y-%m-%d %H:%M:%S')
-        
-        message = f"""
-📦 <b>Package Status Update</b>
-
-Tracking Number: <code>{format_tracking_number(tracking_number)}</code>
-Status: {emoji} <b>{status}</b>
-Time: {last_updated_str}
-
-{details}"""
+        message = STATUS_MESSAGE_TEMPLATE.format_map({
+            'tracking_number': format_tracking_number(tracking_number),
+            'emoji': STATUS_EMOJIS.get(status, '📋'),
+            'status': status,
+            'timestamp': format_timestamp(last_updated),
+            'details': details,
+        })
 
         if include_footer:
-            message += """
-
-<i>This is an automated message. Please do not reply.</i>"""
+            message += STATUS_FOOTER
 
         return message
 
@@ -299,7 +382,7 @@ Time: {last_updated_str}
         tracking_info = TrackingInfo(
             tracking_number=tracking_number,
             chat_id=chat_id,
-            status="Order Placed",
+            status=INITIAL_STATUS,
             status_details="Your order has been placed and is being processed.",
             last_updated=0  # This will be set by SQLite
         )
@@ -324,85 +407,139 @@ Your package is now being tracked. You will receive updates about your package's
             self.send_message(chat_id, NO_TRACKING_MESSAGE)
             return
 
-        status_message = "📋 <b>Your Tracked Packages</b>\n\n"
+        parts = ["📋 <b>Your Tracked Packages</b>\n\n"]
+        last = len(tracked_items) - 1
         for i, item in enumerate(tracked_items):
             # Only include the footer for the last package
-            include_footer = (i == len(tracked_items) - 1)
-            status_message += self.format_status_message(*item, include_footer=include_footer)
+            parts.append(self.format_status_message(*item, include_footer=(i == last)))
         
-        self.send_message(chat_id, status_message)
+        self.send_message(chat_id, "".join(parts))
+
+    def send_status_updates(self, tracked_items: List[Tuple]) -> List[Tuple]:
+        """Send status notifications, one task per chat, and return the rows to retry"""
+        by_chat: Dict[str, List[Tuple]] = defaultdict(list)
+        for row in tracked_items:
+            by_chat[row[1]].append(row)
+
+        # Chats run in parallel; each chat's messages go out in order from a single task
+        futures = [self.executor.submit(self.send_chat_updates, rows) for rows in by_chat.values()]
+
+        failed = []
+        for future in futures:
+            failed.extend(future.result())
+        return failed
+
+    def send_chat_updates(self, rows: List[Tuple]) -> List[Tuple]:
+        """Send one chat's notifications in order, paced per chat, and return the rows to retry"""
+        failed = []
+        for i, row in enumerate(rows):
+            tracking_number, chat_id, current_status, details, last_updated = row
+            if i:
+                time.sleep(PER_CHAT_SEND_INTERVAL)
+            try:
+                message = self.format_status_message(
+                    tracking_number, current_status, details, last_updated
+                )
+                result = self.deliver_message(chat_id, message)
+                if result is SendResult.SENT:
+                    logger.info(f"Sent status update for {tracking_number} to {chat_id}: {current_status}")
+                    continue
+                if result is SendResult.REJECTED:
+                    logger.warning(f"Dropping status update for {tracking_number}: rejected by Telegram")
+                    continue
+            except Exception as e:
+                logger.error(f"Error processing update for {tracking_number}: {str(e)}")
+            failed.append(row)
+        return failed
+
+    def check_status_updates(self) -> None:
+        """Notify chats about rows updated since the last scan"""
+        tracked_items = self.db.get_updated_since(self._watermark)
+        if tracked_items:
+            self._watermark = max(row[4] for row in tracked_items)
+
+        # Retry earlier failures unless a newer version of the row just arrived
+        updated = {row[0] for row in tracked_items}
+        retries = [row for tracking_number, (row, _) in self._failed.items() if tracking_number not in updated]
+
+        failed = {}
+        for row in self.send_status_updates(retries + tracked_items):
+            previous = self._failed.get(row[0])
+            attempts = previous[1] + 1 if previous and previous[0] == row else 1
+            if attempts >= MAX_SEND_ATTEMPTS:
+                logger.warning(f"Giving up on status update for {row[0]} after {attempts} attempts")
+                continue
+            failed[row[0]] = (row, attempts)
+        self._failed = failed
+        logger.debug("Completed status check cycle")
+
+    def status_check_loop(self) -> None:
+        """Scan for status changes every CHECK_INTERVAL, independent of the long poll"""
+        while True:
+            try:
+                self.check_status_updates()
+            except Exception as e:
+                logger.error(f"Unexpected error in status check loop: {str(e)}")
+            time.sleep(CHECK_INTERVAL)
 
     def run(self):
         offset = None
-        last_check = 0
-        last_status_check = {}
         
+        # Set up commands menu in the background so polling starts immediately
+        threading.Thread(target=self.set_commands, daemon=True).start()
+        # Status scans run on their own timer so a blocking long poll can't delay them
+        threading.Thread(target=self.status_check_loop, daemon=True).start()
+
         logger.info("Bot started successfully")
         
         while True:
             try:
-                current_time = time.time()
-                if current_time - last_check >= CHECK_INTERVAL:
-                    # Handle new messages
-                    updates = self.get_updates(offset)
-                    for update in updates:
-                        if "message" not in update or "text" not in update["message"]:
-                            continue
-                            
-                        chat_id = str(update["message"]["chat"]["id"])
-                        text = update["message"]["text"]
-                        offset = update["update_id"] + 1
+                # Handle new messages; the long poll itself paces the loop
+                updates = self.get_updates(offset)
+                for update in updates:
+                    offset = update["update_id"] + 1
+                    if "message" not in update or "text" not in update["message"]:
+                        continue
                         
-                        if text.startswith("/"):
-                            command, *args = text.split()
-                            logger.info(f"Received command: {command} with args: {args}")
-                            self.handle_command(chat_id, command, args)
-                        else:
-                            # If it's not a command, send help message
-                            self.send_message(chat_id, HELP_MESSAGE)
-
-                    # Check for status updates
-                    tracked_items = self.db.get_all_tracking()
-                    for tracking_number, chat_id, current_status, details, last_updated in tracked_items:
-                        try:
-                            # Create a unique key for this tracking number and chat_id
-                            key = f"{tracking_number}_{chat_id}"
-                            
-                            if key not in last_status_check:
-                                last_status_check[key] = {
-                                    'status': current_status,
-                                    'timestamp': last_updated
-                                }
-                                continue
-
-                            last_check_data = last_status_check[key]
-                            if last_updated > last_check_data['timestamp'] and current_status != last_check_data['status']:
-                                message = self.format_status_message(
-                                    tracking_number, current_status, details, last_updated
-                                )
-                                if self.send_message(chat_id, message):
-                                    last_status_check[key] = {
-                                        'status': current_status,
-                                        'timestamp': last_updated
-                                    }
-                                    logger.info(f"Sent status update for {tracking_number} to {chat_id}: {current_status}")
-                        except Exception as e:
-                            logger.error(f"Error processing update for {tracking_number}: {str(e)}")
-                    
-                    # Clean up old entries from last_status_check
-                    current_time = time.time()
-                    last_status_check = {k: v for k, v in last_status_check.items() 
-                                      if current_time - v['timestamp'] < 86400}  # Keep only last 24 hours
+                    chat_id = str(update["message"]["chat"]["id"])
+                    text = update["message"]["text"]
                     
-                    last_check = current_time
-                    logger.debug("Completed status check cycle")
-
-                time.sleep(1)
+                    if text.startswith("/"):
+                        command, *args = text.split()
+                        logger.info(f"Received command: {command} with args: {args}")
+                        self.handle_command(chat_id, command, args)
+                    else:
+                        # If it's not a command, send help message
+                        self.send_message(chat_id, HELP_MESSAGE)
             except Exception as e:
                 logger.error(f"Unexpected error in main loop: {str(e)}")
                 time.sleep(5)
 
 # Message templates
+STATUS_EMOJIS = {
+    'Order Placed': '📦',
+    'Processing': '⚙️',
+    'Picked Up': '🚚',
+    'In Transit': '✈️',
+    'Out for Delivery': '🚛',
+    'Delivered': '✅',
+    'Failed Delivery': '❌',
+    'Returned': '↩️',
+}
+
+STATUS_MESSAGE_TEMPLATE = """
+📦 <b>Package Status Update</b>
+
+Tracking Number: <code>{tracking_number}</code>
+Status: {emoji} <b>{status}</b>
+Time: {timestamp}
+
+{details}"""
+
+STATUS_FOOTER = """
+
+<i>This is an automated message. Please do not reply.</i>"""
+
 HELP_MESSAGE = """
 📦 <b>India Post Tracking Bot Help</b>
 
@@ -479,4 +616,7 @@ Use <code>/help</code> to see available commands.
 
 if __name__ == "__main__":
     bot = TelegramBot()
-    bot.run()
\ No newline at end of file
+    try:
+        bot.run()
+    finally:
+        bot.db.close()
\ No newline at end of file
@@ -0,0 +1,11 @@
+import re
+
+# Format: E/R/A (Speed Post, Registered Post, Air Waybill) + 1 letter + 9 numbers + 'IN'
+# ASCII-only classes and fullmatch, so Unicode digits and trailing newlines are rejected
+_TN_RE = re.compile(r'[ERA][A-Z][0-9]{9}IN')
+
+def is_valid_tracking_number(tracking_number: str) -> bool:
+    """Validate India Post tracking number format"""
+    # Remove spaces from the tracking number
+    s = tracking_number.replace(" ", "")
+    return _TN_RE.fullmatch(s) is not None